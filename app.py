@@ -1,15 +1,27 @@
 from flask import Flask, render_template, request, jsonify
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
 from fake_useragent import UserAgent
 import logging
 import time
 import random
 import json
 import re
+import threading
+import functools
+from cachetools import LRUCache
 from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # Fall back to BeautifulSoup
+    LexborHTMLParser = None
+
+# Result URLs repeat across pages and queries, so memoize parsing them
+_urlparse = functools.lru_cache(maxsize=4096)(urlparse)
+
 app = Flask(__name__)
 
 # Configure logging
@@ -19,18 +31,62 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Only the result and info box subtrees are read from the page. The class
+# attribute is matched as the raw space-separated string while parsing.
+_RESULT_STRAINER = SoupStrainer('div', class_=re.compile(r'(?:^|\s)(?:tF2Cxc|kp-wholepage)(?:\s|$)'))
+
+def _make_soup(html, parse_only=None):
+    """Parse HTML with lxml, falling back to the pure-Python parser"""
+    try:
+        return BeautifulSoup(html, 'lxml', parse_only=parse_only)
+    except FeatureNotFound:
+        return BeautifulSoup(html, 'html.parser', parse_only=parse_only)
+
+def _terms_pattern(terms):
+    """Compile query terms into a single whole-word alternation"""
+    if not terms:
+        return re.compile(r'(?!)')  # Matches nothing
+    # Longest first so a term isn't shadowed by its own prefix
+    terms = sorted(set(terms), key=len, reverse=True)
+    return re.compile(r'(?<!\w)(?:' + '|'.join(map(re.escape, terms)) + r')(?!\w)')
+
+# Category keywords, checked in order; the first category that matches wins
+_CATEGORY_KEYWORDS = {
+    'news': ['news', 'article', 'blog', 'press'],
+    'shopping': ['shop', 'store', 'buy', 'price'],
+    'social': ['facebook.com', 'twitter.com', 'instagram.com', 'linkedin.com'],
+    'video': ['youtube.com', 'vimeo.com', 'watch', 'video'],
+    'academic': ['edu', 'academic', 'research', 'study'],
+    'official': ['gov', 'official', 'organization'],
+    'forums': ['reddit.com', 'quora.com', 'forum', 'discussion'],
+    'tech': ['tech', 'gadget', 'review']
+}
+_CATEGORY_PATTERNS = [
+    (category, re.compile('|'.join(map(re.escape, keywords))))
+    for category, keywords in _CATEGORY_KEYWORDS.items()
+]
+
 class AppleSearch:
     def __init__(self):
-        self.user_agent = UserAgent()
+        # Sample the user agent pool once; picking from a tuple per request
+        # avoids fake_useragent's lookup on every outbound fetch
+        user_agent = UserAgent()
+        self.user_agents = tuple({user_agent.random for _ in range(32)})
         self.session = requests.Session()
+        # Keep-alive pool large enough for the executor's parallel fetches;
+        # retries are handled by _fetch_with_retry
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.base_url = "https://www.google.com/search"
         self.suggest_base_url = "https://suggestqueries.google.com/complete/search"
-        self.cache = {}
+        self.cache = LRUCache(maxsize=1024)  # Bounded so long-running processes don't grow without limit
+        self.cache_lock = threading.Lock()
         self.executor = ThreadPoolExecutor(max_workers=5)  # Increased worker count for better concurrency
 
     def _get_headers(self):
         return {
-            'User-Agent': self.user_agent.random,
+            'User-Agent': random.choice(self.user_agents),
             'Accept': 'text/html,application/xhtml+xml',
             'Accept-Language': 'en-US,en;q=0.5',
             'Referer': 'https://www.apple.com/',
@@ -39,10 +95,31 @@ class AppleSearch:
             'Upgrade-Insecure-Requests': '1'
         }
 
-    def _extract_info_box(self, soup):
+    def _extract_info_box(self, tree):
         """Extract information box content if available"""
         try:
             # Update selector to match Google's latest info box structure
+            info_box = tree.css_first('div.kp-wholepage')
+            if not info_box:
+                return None
+
+            title = info_box.css_first('h2.qrShPb') or info_box.css_first('div.kno-ecr-pt')  # Alternate selector
+            description = info_box.css_first('div.LGOjhe') or info_box.css_first('div.kno-rdesc')
+            image = info_box.css_first('g-img') or info_box.css_first('img.kno-fb-ctx')
+
+            return {
+                'title': title.text(strip=True) if title else '',
+                'description': description.text(strip=True) if description else '',
+                'image_url': (image.attributes.get('src') or None) if image else None,
+                'type': 'info_box'
+            }
+        except Exception as e:
+            logging.error(f"Error parsing info box: {e}")
+        return None
+
+    def _extract_info_box_soup(self, soup):
+        """BeautifulSoup fallback for _extract_info_box"""
+        try:
             info_box = soup.find('div', {'class': 'kp-wholepage'})
             if not info_box:
                 return None
@@ -62,32 +139,76 @@ class AppleSearch:
         return None
 
 
-    def _categorize_result(self, url, title):
-        """Categorize search result based on URL and title"""
-        domain = urlparse(url).netloc.lower()
-        
-        categories = {
-            'news': ['news', 'article', 'blog', 'press'],
-            'shopping': ['shop', 'store', 'buy', 'price'],
-            'social': ['facebook.com', 'twitter.com', 'instagram.com', 'linkedin.com'],
-            'video': ['youtube.com', 'vimeo.com', 'watch', 'video'],
-            'academic': ['edu', 'academic', 'research', 'study'],
-            'official': ['gov', 'official', 'organization'],
-            'forums': ['reddit.com', 'quora.com', 'forum', 'discussion'],
-            'tech': ['tech', 'gadget', 'review']
-        }
-        
-        for category, keywords in categories.items():
-            if any(keyword in domain for keyword in keywords) or \
-               any(keyword in title.lower() for keyword in keywords):
+    def _categorize_result(self, domain, title_lower):
+        """Categorize search result based on its lowercased domain and title"""
+        for category, pattern in _CATEGORY_PATTERNS:
+            if pattern.search(domain) or pattern.search(title_lower):
                 return category
         
         return 'general'
 
+    def _build_result(self, url, title, snippet, date=None):
+        """Build the result dict shared by both parser backends"""
+        # Lowercase once; categorization and _rank_results both read these
+        title_lower = title.lower()
+        snippet_lower = snippet.lower()
+        netloc = _urlparse(url).netloc
+        domain = netloc.lower()
+        result = {
+            'title': title,
+            'url': url,
+            'display_url': url[:60] + '...' if len(url) > 60 else url,
+            'snippet': snippet,
+            'favicon': f"https://www.google.com/s2/favicons?domain={domain}",
+            'category': self._categorize_result(domain, title_lower),
+            'type': 'regular',
+            'score': 0,
+            '_title_lower': title_lower,
+            '_snippet_lower': snippet_lower,
+            '_netloc': netloc  # As-is; ranking's authority check is case-sensitive
+        }
+        if date:
+            result['date'] = date
+        return result
+
     def _parse_results(self, html):
-        soup = BeautifulSoup(html, 'html.parser')
+        if LexborHTMLParser is None:
+            return self._parse_results_soup(html)
+
+        tree = LexborHTMLParser(html)
+        results = []
+        info_box = self._extract_info_box(tree)
+
+        if info_box:
+            results.append(info_box)
+
+        for div in tree.css('div.tF2Cxc'):
+            try:
+                title_elem = div.css_first('h3')
+                link = div.css_first('a')
+                url = link.attributes.get('href') if link else None
+                snippet_elem = div.css_first('div.VwiC3b')
+                snippet = snippet_elem.text() if snippet_elem else ''
+
+                if not url or not title_elem:
+                    continue
+
+                # Extract date if available
+                date_elem = div.css_first('span.MUxGbd')
+                date = date_elem.text() if date_elem else None
+
+                results.append(self._build_result(url, title_elem.text(), snippet, date))
+            except Exception as e:
+                logging.error(f"Error parsing result: {e}")
+                continue
+
+        return results
+
+    def _parse_results_soup(self, html):
+        """BeautifulSoup fallback for environments without selectolax"""
+        soup = _make_soup(html, parse_only=_RESULT_STRAINER)
         results = []
-        info_box = self._extract_info_box(soup)
+        info_box = self._extract_info_box_soup(soup)
         
         if info_box:
             results.append(info_box)
@@ -103,24 +224,11 @@ class AppleSearch:
                 if not url or not title_elem:
                     continue
 
-                # Enhanced result object
-                result = {
-                    'title': title_elem.get_text(),
-                    'url': url,
-                    'display_url': url[:60] + '...' if len(url) > 60 else url,
-                    'snippet': snippet,
-                    'favicon': f"https://www.google.com/s2/favicons?domain={url}",
-                    'category': self._categorize_result(url, title_elem.get_text()),
-                    'type': 'regular',
-                    'score': 0
-                }
-                
                 # Extract date if available
                 date_elem = div.find('span', {'class': 'MUxGbd'})
-                if date_elem:
-                    result['date'] = date_elem.get_text()
+                date = date_elem.get_text() if date_elem else None
 
-                results.append(result)
+                results.append(self._build_result(url, title_elem.get_text(), snippet, date))
             except Exception as e:
                 logging.error(f"Error parsing result: {e}")
                 continue
@@ -131,7 +239,9 @@ class AppleSearch:
         """Fetch URL with retry mechanism"""
         for attempt in range(max_retries):
             try:
-                time.sleep(random.uniform(0.5, 1.5))
+                if attempt > 0:
+                    # Exponential backoff with jitter, only between retries
+                    time.sleep(random.uniform(0.1, 0.3) * (2 ** attempt))
                 response = self.session.get(
                     url,
                     params=params,
@@ -148,10 +258,30 @@ class AppleSearch:
                     raise
         return None
 
+    def _bundle_results(self, results):
+        """Bundle ranked results with their category grouping and info box"""
+        categorized_results = {}
+        for result in results:
+            if result['type'] == 'info_box':
+                continue
+            category = result['category']
+            if category not in categorized_results:
+                categorized_results[category] = []
+            categorized_results[category].append(result)
+
+        return {
+            'flat': results,
+            'grouped': categorized_results,
+            'info_box': next((r for r in results if r['type'] == 'info_box'), None)
+        }
+
     def search(self, query, page=1):
+        """Search and return a bundle of 'flat', 'grouped' and 'info_box' results"""
         cache_key = f"{query}_{page}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        with self.cache_lock:
+            cached_bundle = self.cache.get(cache_key)
+        if cached_bundle is not None:
+            return cached_bundle
 
         try:
             params = {
@@ -163,19 +293,24 @@ class AppleSearch:
             
             response = self._fetch_with_retry(self.base_url, params)
             if not response:
-                return []
+                return self._bundle_results([])
 
             results = self._parse_results(response.text)
             ranked_results = self._rank_results(query, results)
-            self.cache[cache_key] = ranked_results
-            return ranked_results
+            # Cache the grouped view too so cache hits skip regrouping
+            bundle = self._bundle_results(ranked_results)
+            with self.cache_lock:
+                self.cache[cache_key] = bundle
+            return bundle
 
         except Exception as e:
             logging.error(f"Search error: {e}")
-            return []
+            return self._bundle_results([])
 
     def _rank_results(self, query, results):
-        keywords = query.lower().split()
+        query_lower = query.lower()
+        keywords = query_lower.split()
+        keyword_re = _terms_pattern(keywords)
         
         for result in results:
             if result['type'] == 'info_box':
@@ -183,24 +318,24 @@ class AppleSearch:
                 continue
 
             score = 0
-            title_lower = result['title'].lower()
-            snippet_lower = result['snippet'].lower()
+            title_lower = result['_title_lower']
+            snippet_lower = result['_snippet_lower']
 
             # Exact phrase matches for relevance
-            if query.lower() in title_lower:
+            if query_lower in title_lower:
                 score += 20
-            if query.lower() in snippet_lower:
+            if query_lower in snippet_lower:
                 score += 10
 
-            # Keyword matches in title and snippet
-            title_keywords = sum(1 for word in keywords if word in title_lower)
-            snippet_keywords = sum(1 for word in keywords if word in snippet_lower)
+            # Keyword matches in title and snippet (distinct terms found)
+            title_keywords = len(set(keyword_re.findall(title_lower)))
+            snippet_keywords = len(set(keyword_re.findall(snippet_lower)))
             score += title_keywords * 3 + snippet_keywords * 2
 
             # Authority and freshness boosts
             if '2024' in result.get('date', ''):
                 score += 10  # Freshness bonus for recent content
-            domain = urlparse(result['url']).netloc
+            domain = result['_netloc']
             if any(tld in domain for tld in ['.edu', '.gov', '.org']):
                 score += 8  # Authority bonus for reputable domains
 
@@ -228,8 +363,15 @@ class AppleSearch:
                 'client': 'firefox',
                 'q': query
             }
-            response = self._fetch_with_retry(self.suggest_base_url, params)
-            if response and response.status_code == 200:
+            # Called on every keystroke: one quick request on the pooled
+            # session, no retries or backoff sleeps holding the worker
+            response = self.session.get(
+                self.suggest_base_url,
+                params=params,
+                headers=self._get_headers(),
+                timeout=2
+            )
+            if response.status_code == 200:
                 return response.json()[1]
         except Exception as e:
             logging.error(f"Suggestion fetch error: {e}")
@@ -251,26 +393,15 @@ def search():
         return render_template('apple_search.html')
     
     try:
-        results = search_engine.search(query, page)
-        
-        # Group results by category
-        categorized_results = {}
-        for result in results:
-            if result['type'] == 'info_box':
-                continue
-            category = result['category']
-            if category not in categorized_results:
-                categorized_results[category] = []
-            categorized_results[category].append(result)
-        
-        info_box = next((r for r in results if r['type'] == 'info_box'), None)
+        bundle = search_engine.search(query, page)
+        results = bundle['flat']
         
         return render_template(
             'apple_search.html',
             query=query,
             results=results,
-            categorized_results=categorized_results,
-            info_box=info_box,
+            categorized_results=bundle['grouped'],
+            info_box=bundle['info_box'],
             page=page,
             total_results=len(results)
         )
@@ -1,19 +1,29 @@
 from flask import Flask, render_template, request, jsonify, abort
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
 from fake_useragent import UserAgent
 import logging
 from logging.handlers import RotatingFileHandler
 import time
 import random
-import json
+import orjson
 from urllib.parse import urlparse, quote_plus
 import redis
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
-import hashlib
 import re
 import threading
+import functools
+from cachetools import TTLCache
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # Fall back to BeautifulSoup
+    LexborHTMLParser = None
+
+# Result URLs repeat across engines and queries, so memoize parsing them
+_urlparse = functools.lru_cache(maxsize=4096)(urlparse)
 
 app = Flask(__name__)
 
@@ -31,11 +41,55 @@ app.logger.setLevel(logging.INFO)
 
 # Initialize Redis for caching
 try:
-    redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+    # One bounded pool shared by all Flask worker threads; callers wait for a
+    # free connection instead of opening a new socket per request
+    redis_pool = redis.BlockingConnectionPool(host='localhost', port=6379, db=0, max_connections=32)
+    redis_client = redis.Redis(connection_pool=redis_pool)  # Raw bytes for orjson
 except:
     app.logger.warning("Redis not available, falling back to in-memory cache")
     redis_client = None
 
+# Only the result subtrees are read from the page. The class attribute is
+# matched as the raw space-separated string while parsing.
+_RESULT_STRAINER = SoupStrainer(['div', 'article'], class_=re.compile(r'(?:^|\s)(?:g|result)(?:\s|$)'))
+
+def _make_soup(html, parse_only=None):
+    """Parse HTML with lxml, falling back to the pure-Python parser"""
+    try:
+        return BeautifulSoup(html, 'lxml', parse_only=parse_only)
+    except FeatureNotFound:
+        return BeautifulSoup(html, 'html.parser', parse_only=parse_only)
+
+def _terms_pattern(terms):
+    """Compile query terms into a single whole-word alternation"""
+    if not terms:
+        return re.compile(r'(?!)')  # Matches nothing
+    # Longest first so a term isn't shadowed by its own prefix
+    terms = sorted(set(terms), key=len, reverse=True)
+    return re.compile(r'(?<!\w)(?:' + '|'.join(map(re.escape, terms)) + r')(?!\w)')
+
+# Date formats found in result snippets: "5 Mar 2024", "2024-03-05", "3/5/2024"
+_DATE_RE = re.compile(
+    r'\d{1,2}\s(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s\d{4}'
+    r'|\d{4}-\d{2}-\d{2}'
+    r'|\d{1,2}/\d{1,2}/\d{4}'
+)
+
+# Category keywords, checked in order; the first category that matches wins
+_CATEGORY_KEYWORDS = {
+    'news': ['news', 'breaking', 'latest', 'report', 'update'],
+    'shopping': ['shop', 'buy', 'price', 'deal', 'amazon', 'store'],
+    'social': ['facebook', 'twitter', 'instagram', 'linkedin', 'reddit'],
+    'video': ['youtube', 'video', 'watch', 'stream', 'vimeo'],
+    'academic': ['research', 'study', 'paper', 'journal', '.edu'],
+    'official': ['official', 'gov', 'organization', '.gov', '.org'],
+    'tech': ['technology', 'software', 'hardware', 'review', 'digital']
+}
+_CATEGORY_PATTERNS = [
+    (category, re.compile('|'.join(map(re.escape, keywords))))
+    for category, keywords in _CATEGORY_KEYWORDS.items()
+]
+
 class SearchResult:
     def __init__(self, title, url, snippet, category='general', date=None, favicon=None):
         self.title = title
@@ -43,9 +97,15 @@ class SearchResult:
         self.snippet = snippet
         self.category = category
         self.date = date
-        self.favicon = favicon or f"https://www.google.com/s2/favicons?domain={url}"
+        self.netloc = _urlparse(url).netloc  # As-is, for ranking
+        self.domain = self.netloc.lower()
+        self.favicon = favicon or f"https://www.google.com/s2/favicons?domain={self.domain}"
         self.score = 0
 
+        # Lowercased fields shared by categorization and ranking
+        self.title_lower = title.lower()
+        self.snippet_lower = snippet.lower()
+
     def to_dict(self):
         return {
             'title': self.title,
@@ -62,49 +122,49 @@ class SearchResult:
 class ImprovedSearch:
     def __init__(self):
         self.session = requests.Session()
-        self.user_agent = UserAgent(fallback='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
+        # Keep-alive pool large enough for the executor's parallel fetches;
+        # retries are handled by _fetch_with_retry
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Sample the user agent pool once; picking from a tuple per request
+        # avoids fake_useragent's lookup on every outbound fetch
+        user_agent = UserAgent(fallback='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
+        self.user_agents = tuple({user_agent.random for _ in range(32)})
         self.executor = ThreadPoolExecutor(max_workers=5)
         self.search_urls = [
             "https://www.google.com/search",
             "https://www.bing.com/search"  # Backup search engine
         ]
         if not redis_client:
-            self.in_memory_cache = {}
+            # TTLCache is not thread-safe, so access still goes through cache_lock
+            self.in_memory_cache = TTLCache(maxsize=2048, ttl=3600)
             self.cache_lock = threading.Lock()
 
-    def _get_cache_key(self, query, page):
-        """Generate unique cache key for query"""
-        return hashlib.md5(f"{query}_{page}".encode()).hexdigest()
-
     def _get_from_cache(self, key):
         """Retrieve results from cache"""
         if redis_client:
             cached = redis_client.get(key)
             if cached:
-                return json.loads(cached)
+                return orjson.loads(cached)
         else:
             with self.cache_lock:
-                entry = self.in_memory_cache.get(key)
-                if entry:
-                    data, expire_time = entry
-                    if time.time() < expire_time:
-                        return data
-                    else:
-                        del self.in_memory_cache[key]
+                return self.in_memory_cache.get(key)
         return None
 
     def _save_to_cache(self, key, data, expire_time=3600):
         """Save results to cache"""
         if redis_client:
-            redis_client.setex(key, expire_time, json.dumps(data))
+            redis_client.setex(key, expire_time, orjson.dumps(data))
         else:
+            # expire_time only applies to Redis; the TTLCache uses its own TTL
             with self.cache_lock:
-                self.in_memory_cache[key] = (data, time.time() + expire_time)
+                self.in_memory_cache[key] = data
 
     def _get_headers(self):
         """Generate random headers for requests"""
         return {
-            'User-Agent': self.user_agent.random,
+            'User-Agent': random.choice(self.user_agents),
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
             'DNT': '1',
@@ -148,48 +208,83 @@ class ImprovedSearch:
 
     def _extract_date(self, text):
         """Extract date from result snippet"""
-        date_patterns = [
-            r'\d{1,2}\s(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s\d{4}',
-            r'\d{4}-\d{2}-\d{2}',
-            r'\d{1,2}/\d{1,2}/\d{4}'
-        ]
-
-        for pattern in date_patterns:
-            match = re.search(pattern, text)
-            if match:
-                try:
-                    return datetime.strptime(match.group(), '%Y-%m-%d').strftime('%b %d, %Y')
-                except:
-                    return match.group()
+        match = _DATE_RE.search(text)
+        if match:
+            try:
+                return datetime.strptime(match.group(), '%Y-%m-%d').strftime('%b %d, %Y')
+            except:
+                return match.group()
         return None
 
-    def _categorize_result(self, url, title, snippet):
-        """Enhanced result categorization"""
-        domain = urlparse(url).netloc.lower()
-        text = f"{title.lower()} {snippet.lower()}"
-
-        categories = {
-            'news': ['news', 'breaking', 'latest', 'report', 'update'],
-            'shopping': ['shop', 'buy', 'price', 'deal', 'amazon', 'store'],
-            'social': ['facebook', 'twitter', 'instagram', 'linkedin', 'reddit'],
-            'video': ['youtube', 'video', 'watch', 'stream', 'vimeo'],
-            'academic': ['research', 'study', 'paper', 'journal', '.edu'],
-            'official': ['official', 'gov', 'organization', '.gov', '.org'],
-            'tech': ['technology', 'software', 'hardware', 'review', 'digital']
-        }
-
-        for category, keywords in categories.items():
-            if any(keyword in domain for keyword in keywords) or \
-               any(keyword in text for keyword in keywords):
+    def _categorize_result(self, domain, title_lower, snippet_lower):
+        """Enhanced result categorization from already-lowercased fields"""
+        for category, pattern in _CATEGORY_PATTERNS:
+            if pattern.search(domain) or pattern.search(title_lower) or pattern.search(snippet_lower):
                 return category
 
         return 'general'
 
+    def _build_result(self, title, url, snippet):
+        """Build a SearchResult shared by both parser backends"""
+        if url.startswith('/url?q='):
+            url = url.split('/url?q=')[1].split('&')[0]
+        if not (title and url and snippet):
+            return None
+        result = SearchResult(title, url, snippet, date=self._extract_date(snippet))
+        # Reuse the fields SearchResult already lowercased for ranking
+        result.category = self._categorize_result(result.domain, result.title_lower, result.snippet_lower)
+        return result
+
     def _parse_results(self, html):
         """Enhanced result parsing with better error handling"""
+        if LexborHTMLParser is None:
+            return self._parse_results_soup(html)
+
         results = []
         try:
-            soup = BeautifulSoup(html, 'html.parser')
+            tree = LexborHTMLParser(html)
+
+            # Parse Google-style results
+            for div in tree.css('div.g, div.result, article.g, article.result'):
+                try:
+                    # Extract title
+                    title_elem = div.css_first('h3, h2, h1')
+                    if not title_elem:
+                        continue
+                    title = title_elem.text(strip=True)
+
+                    # Extract URL
+                    link = div.css_first('a')
+                    if not link or not link.attributes.get('href'):
+                        continue
+                    url = link.attributes['href']
+
+                    # Extract snippet
+                    snippet_elem = div.css_first(
+                        'div.VwiC3b, div.snippet, div.description, '
+                        'span.VwiC3b, span.snippet, span.description'
+                    )
+                    snippet = snippet_elem.text(strip=True) if snippet_elem else ''
+
+                    # Create result object
+                    result = self._build_result(title, url, snippet)
+                    if result:
+                        results.append(result)
+
+                except Exception as e:
+                    app.logger.error(f"Error parsing individual result: {str(e)}")
+                    continue
+
+        except Exception as e:
+            app.logger.error(f"Error parsing HTML: {str(e)}")
+
+        return results
+
+    def _parse_results_soup(self, html):
+        """BeautifulSoup fallback for environments without selectolax"""
+        results = []
+        try:
+            soup = _make_soup(html, parse_only=_RESULT_STRAINER)
 
             # Parse Google-style results
             for div in soup.find_all(['div', 'article'], {'class': ['g', 'result']}):
@@ -205,18 +300,14 @@ class ImprovedSearch:
                     if not link or not link.get('href'):
                         continue
                     url = link['href']
-                    if url.startswith('/url?q='):
-                        url = url.split('/url?q=')[1].split('&')[0]
 
                     # Extract snippet
                     snippet_elem = div.find(['div', 'span'], {'class': ['VwiC3b', 'snippet', 'description']})
                     snippet = snippet_elem.get_text(strip=True) if snippet_elem else ''
 
                     # Create result object
-                    if title and url and snippet:
-                        date = self._extract_date(snippet)
-                        category = self._categorize_result(url, title, snippet)
-                        result = SearchResult(title, url, snippet, category, date)
+                    result = self._build_result(title, url, snippet)
+                    if result:
                         results.append(result)
 
                 except Exception as e:
@@ -230,33 +321,36 @@ class ImprovedSearch:
 
     def _rank_results(self, query, results):
         """Enhanced result ranking"""
-        query_terms = query.lower().split()
+        query_lower = query.lower()
+        query_terms = query_lower.split()
+        terms_re = _terms_pattern(query_terms)
+        now = datetime.now()
 
         for result in results:
             score = 0
 
             # Title matching
-            title_lower = result.title.lower()
-            if query.lower() in title_lower:
+            title_lower = result.title_lower
+            if query_lower in title_lower:
                 score += 30  # Exact query match in title
-            score += sum(10 for term in query_terms if term in title_lower)
+            score += 10 * len(set(terms_re.findall(title_lower)))
 
             # URL quality
-            domain = urlparse(result.url).netloc
+            domain = result.netloc
             if any(tld in domain for tld in ['.edu', '.gov', '.org']):
                 score += 15  # Trusted domains
             if len(domain.split('.')) == 2:  # Prefer root domains
                 score += 5
 
             # Content relevance
-            snippet_lower = result.snippet.lower()
-            score += sum(5 for term in query_terms if term in snippet_lower)
+            snippet_lower = result.snippet_lower
+            score += 5 * len(set(terms_re.findall(snippet_lower)))
 
             # Freshness
             if result.date:
                 try:
                     date = datetime.strptime(result.date, '%b %d, %Y')
-                    days_old = (datetime.now() - date).days
+                    days_old = (now - date).days
                     if days_old < 30:
                         score += 20  # Very recent
                     elif days_old < 90:
@@ -272,7 +366,7 @@ class ImprovedSearch:
 
         return sorted(results, key=lambda x: x.score, reverse=True)
 
-    def _search_single_engine(self, search_url, query, page):
+    def _search_single_engine(self, search_url, query, page, stop_event=None):
         try:
             params = {
                 'q': query,
@@ -282,6 +376,8 @@ class ImprovedSearch:
                 'safe': 'active'
             }
             response = self._fetch_with_retry(search_url, params)
+            if stop_event is not None and stop_event.is_set():
+                return []  # Another engine already returned enough results
             if response and response.text:
                 current_results = self._parse_results(response.text)
                 return current_results
@@ -290,45 +386,92 @@ class ImprovedSearch:
             return []
         return []
 
+    def _dedupe_results(self, results):
+        """Drop results whose URL another engine already returned"""
+        seen = set()
+        unique_results = []
+        for result in results:
+            # Ignore scheme, host case and fragment when comparing URLs
+            parsed = _urlparse(result.url)
+            key = (result.domain, parsed.path, parsed.params, parsed.query)
+            if key not in seen:
+                seen.add(key)
+                unique_results.append(result)
+        return unique_results
+
+    def _group_results(self, results):
+        """Group serialized results by category for the results page"""
+        categorized_results = {}
+        for result in results:
+            if result['type'] == 'info_box':
+                continue
+            category = result['category']
+            if category not in categorized_results:
+                categorized_results[category] = []
+            categorized_results[category].append(result)
+        return categorized_results
+
     def search(self, query, page=1):
-        """Main search method with fallback and error handling"""
-        cache_key = self._get_cache_key(query, page)
-        cached_results = self._get_from_cache(cache_key)
+        """Main search method with fallback and error handling
 
-        if cached_results:
-            return cached_results
+        Returns a dict with the ranked results under 'flat' and the same
+        results grouped by category under 'grouped'.
+        """
+        # Tuples hash cheaply for the in-memory cache; Redis keys must be strings
+        cache_key = f"s:{page}:{query}" if redis_client else (query, page)
+        cached = self._get_from_cache(cache_key)
+
+        if cached:
+            if redis_client:
+                # Redis holds only the flat list (see below)
+                return {'flat': cached, 'grouped': self._group_results(cached)}
+            return cached
 
         results = []
         errors = []
 
         # Submit tasks to the executor
-        futures = []
+        stop_event = threading.Event()
+        pending = set()
         for search_url in self.search_urls:
-            future = self.executor.submit(self._search_single_engine, search_url, query, page)
-            futures.append(future)
+            future = self.executor.submit(self._search_single_engine, search_url, query, page, stop_event)
+            pending.add(future)
 
-        # Collect results as they complete
-        for future in as_completed(futures):
-            try:
-                current_results = future.result()
-                results.extend(current_results)
-                if len(results) >= 5:  # We have enough results
-                    break
-            except Exception as e:
-                errors.append(str(e))
-                continue
+        # Collect results as they complete, stopping once we have enough
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results.extend(future.result())
+                except Exception as e:
+                    errors.append(str(e))
+            if len(results) >= 5:  # We have enough results
+                break
+
+        # Drop the remaining engines: unstarted ones are cancelled and
+        # in-flight ones skip parsing once their fetch returns
+        stop_event.set()
+        for future in pending:
+            future.cancel()
 
         if not results and errors:
             app.logger.error("\n".join(errors))
-            return []
+            return {'flat': [], 'grouped': {}}
 
-        ranked_results = self._rank_results(query, results)
+        ranked_results = self._rank_results(query, self._dedupe_results(results))
         serialized_results = [result.to_dict() for result in ranked_results]
 
-        # Cache the results
-        self._save_to_cache(cache_key, serialized_results)
+        bundle = {
+            'flat': serialized_results,
+            'grouped': self._group_results(serialized_results)
+        }
+        if serialized_results:
+            # In memory the grouped view shares the result dicts, so hits skip
+            # regrouping. Serialized to Redis it would store every result twice
+            # and decode slower than regrouping, so Redis gets the flat list.
+            self._save_to_cache(cache_key, serialized_results if redis_client else bundle)
 
-        return serialized_results
+        return bundle
 
     def get_suggestions(self, query):
         """Get search suggestions with error handling"""
@@ -344,15 +487,20 @@ class ImprovedSearch:
         try:
             params = {
                 'client': 'chrome',
-                'q': query
+                'q': query,
+                'oe': 'utf-8'  # orjson only decodes UTF-8
             }
-            response = self._fetch_with_retry(
+            # Called on every keystroke: one quick request on the pooled
+            # session, no retries or backoff sleeps holding the worker
+            response = self.session.get(
                 'https://suggestqueries.google.com/complete/search',
-                params
+                params=params,
+                headers=self._get_headers(),
+                timeout=2
             )
 
-            if response and response.status_code == 200:
-                suggestions = json.loads(response.text)[1]
+            if response.status_code == 200:
+                suggestions = orjson.loads(response.content)[1]
                 self._save_to_cache(cache_key, suggestions, expire_time=1800)
                 return suggestions
 
@@ -377,23 +525,14 @@ def search():
         return render_template('search.html')
 
     try:
-        results = search_engine.search(query, page)
-
-        # Group results by category
-        categorized_results = {}
-        for result in results:
-            if result['type'] == 'info_box':
-                continue
-            category = result['category']
-            if category not in categorized_results:
-                categorized_results[category] = []
-            categorized_results[category].append(result)
+        bundle = search_engine.search(query, page)
+        results = bundle['flat']
 
         return render_template(
             'search.html',
             query=query,
             results=results,
-            categorized_results=categorized_results,
+            categorized_results=bundle['grouped'],
             page=page,
             total_results=len(results)
         )